@@ -13,326 +13,515 @@ KEY_MAP = {
     'a': 0, 'w': 1, 's': 2, 'e': 3, 'd': 4, 'f': 5, 't': 6, 'g': 7, 'y': 8, 'h': 9, 'u': 10, 'j': 11,
     'k': 12, 'o': 13, 'l': 14, 'p': 15, ';': 16, "'": 17, 'z': 18, 'x': 19, 'c': 20, 'v': 21, 'b': 22, 'n': 23, 'm': 24
 }
-
-# --- Piano Key Frequencies ---
-def get_frequency(midi_note_number):
-    """Calculates the frequency for a given MIDI note number."""
-    return 440 * (2 ** ((midi_note_number - 69) / 12))
+# Inverse lookup: key offset -> keyboard key
+INV_KEY_MAP = {v: k for k, v in KEY_MAP.items()}
+
+# Key type and colour for each semitone of the octave
+KEY_TYPES = (
+    ("white", True),  # C
+    ("black", False), # C#
+    ("white", True),  # D
+    ("black", False), # D#
+    ("white", True),  # E
+    ("white", True),  # F
+    ("black", False), # F#
+    ("white", True),  # G
+    ("black", False), # G#
+    ("white", True),  # A
+    ("black", False), # A#
+    ("white", True)   # B
+)
+# Vectorised form of KEY_TYPES, indexed by semitone
+IS_WHITE_ARR = np.array([is_white for _, is_white in KEY_TYPES])
 
 # --- Piano Key Layout Logic ---
+@st.cache_data(show_spinner=False)
 def get_key_info(start_midi_note, num_keys):
     """
     Generates layout information for a piano keyboard.
     Returns a list of dictionaries, one for each key.
     """
-    keys = []
-    white_key_count = 0
-    key_types = [
-        ("white", True),  # C
-        ("black", False), # C#
-        ("white", True),  # D
-        ("black", False), # D#
-        ("white", True),  # E
-        ("white", True),  # F
-        ("black", False), # F#
-        ("white", True),  # G
-        ("black", False), # G#
-        ("white", True),  # A
-        ("black", False), # A#
-        ("white", True)   # B
-    ]
-
-    for i in range(num_keys):
-        current_midi_note = start_midi_note + i
-        note_in_octave_idx = (current_midi_note - 21) % 12  # A0 is MIDI 21
-        key_type_info = key_types[note_in_octave_idx]
-        is_white_key = key_type_info[1]
-        
-        # Map a keyboard key to the piano key if available
-        keyboard_key = None
-        for k, v in KEY_MAP.items():
-            if v == i:
-                keyboard_key = k
-                break
-
-        if is_white_key:
-            x_position = white_key_count * KEY_WIDTH_PX
-            white_key_count += 1
-            width = KEY_WIDTH_PX
-            height = KEY_HEIGHT_PX
-            color = "#FFFFFF"
-            z_index = 1
-            label = f"C{(current_midi_note // 12) - 1}" if note_in_octave_idx == 0 else ""
-        else:
-            width = KEY_WIDTH_PX * BLACK_KEY_WIDTH_RATIO
-            height = KEY_HEIGHT_PX * BLACK_KEY_HEIGHT_RATIO
-            color = "#333333"
-            z_index = 2
-            label = ""
-            
-            # Manual horizontal positioning for black keys
-            offset_factor = 0.6
-            x_position = (white_key_count - 1) * KEY_WIDTH_PX + (KEY_WIDTH_PX * offset_factor) - (width / 2)
+    # Compute each layout column as a NumPy array, then build the dicts once
+    notes = np.arange(start_midi_note, start_midi_note + num_keys)
+    note_in_octave_idx = (notes - 21) % 12  # A0 is MIDI 21
+    is_white = IS_WHITE_ARR[note_in_octave_idx]
+    white_prefix = np.cumsum(is_white) - is_white  # White keys to the left of each key
+
+    black_width = KEY_WIDTH_PX * BLACK_KEY_WIDTH_RATIO
+    offset_factor = 0.6  # Manual horizontal positioning for black keys
+    x = np.where(
+        is_white,
+        white_prefix * KEY_WIDTH_PX,
+        (white_prefix - 1) * KEY_WIDTH_PX + (KEY_WIDTH_PX * offset_factor) - (black_width / 2)
+    )
+    freqs = 440.0 * np.exp2((notes - 69) / 12.0)
+    freq_labels = np.char.mod('%.2f', freqs)  # Tooltip text, formatted in one pass
 
+    keys = []
+    columns = zip(
+        notes.tolist(), note_in_octave_idx.tolist(), is_white.tolist(),
+        freqs.tolist(), freq_labels.tolist(), white_prefix.tolist(), x.tolist()
+    )
+    for i, (midi_note, semitone, white, frequency, frequency_label, slot, x_position) in enumerate(columns):
         keys.append({
-            "midi_note": current_midi_note,
-            "frequency": get_frequency(current_midi_note),
-            "type": key_type_info[0],
+            "midi_note": midi_note,
+            "frequency": frequency,
+            "frequency_label": frequency_label,
+            "type": KEY_TYPES[semitone][0],
+            "slot": slot,
             "x": x_position,
-            "y": 0,
-            "width": width,
-            "height": height,
-            "color": color,
-            "z_index": z_index,
-            "label": label,
-            "keyboard_key": keyboard_key
+            "label": f"C{(midi_note // 12) - 1}" if white and semitone == 0 else "",
+            "keyboard_key": INV_KEY_MAP.get(i)
         })
 
     return keys
 
-# --- Streamlit App ---
-st.set_page_config(layout="centered", page_title="Streamlit Virtual Piano")
-
-st.title("Streamlit Virtual Piano")
-st.markdown("Play using your **mouse** or **keyboard**! Press the **spacebar** for sustain.")
-st.write("---")
-
-# --- Piano Settings ---
-col1, col2, col3 = st.columns([1, 1, 0.7])
-
-with col1:
-    num_keys = st.slider(
-        "Number of Keys",
-        min_value=12,
-        max_value=30,
-        value=DEFAULT_KEYS,
-        step=1,
-        help="Adjust the total number of piano keys."
+# --- Piano Keyboard HTML ---
+# Per-key markup, formatted from the dictionaries returned by get_key_info.
+# Geometry lives in the stylesheet; each key only carries its position class.
+KEY_TMPL = (
+    '<div class="piano-key {type}-key pk-{type[0]}-{slot}" '
+    'data-frequency="{frequency}" data-keyboard-key="{keyboard_key}" '
+    'title="MIDI: {midi_note} | Freq: {frequency_label} Hz | Key: {keyboard_key}">'
+    '{label} {kk_span}</div>'
+)
+
+@st.cache_data(show_spinner=False)
+def build_piano_html(start_midi_note, num_keys):
+    """
+    Builds the static piano markup (styles, container and keys).
+    Depends only on the keyboard layout, so it is cached across reruns.
+    """
+    piano_keys = get_key_info(start_midi_note, num_keys)
+    total_white_keys = sum(1 for key in piano_keys if key['type'] == 'white')
+    piano_width = total_white_keys * KEY_WIDTH_PX
+    position_rules = "\n".join(
+        f"    .pk-{key['type'][0]}-{key['slot']} {{ left: {key['x']}px; }}" for key in piano_keys
     )
 
-with col2:
-    start_midi_note = st.slider(
-        "Starting MIDI Note (C4=60)",
-        min_value=21,
-        max_value=96,
-        value=60,
-        step=1,
-        help="Select the MIDI note number for the leftmost key."
-    )
+    # HTML and CSS for the piano
+    html_content_prefix = f"""
+    <style>
+    .piano-container {{
+        position: relative;
+        width: {piano_width}px;
+        height: {KEY_HEIGHT_PX}px;
+        margin: 20px auto;
+        border: 2px solid #555;
+        background-color: #eee;
+        border-radius: 5px;
+        box-shadow: 0 5px 15px rgba(0,0,0,0.3);
+        overflow: hidden;
+        touch-action: none; /* Finger drags shouldn't pan and cancel the note */
+    }}
+    .piano-key {{
+        position: absolute;
+        top: 0;
+        cursor: pointer;
+        box-sizing: border-box;
+        border-radius: 0 0 3px 3px;
+        transition: all 0.1s ease;
+        display: flex;
+        justify-content: center;
+        align-items: flex-end;
+        padding-bottom: 5px;
+        font-size: 0.8em;
+        user-select: none;
+    }}
+    .piano-key-label {{
+        position: absolute;
+        bottom: 5px;
+        font-size: 0.7em;
+        color: #555;
+    }}
+    .piano-key.white-key {{
+        width: {KEY_WIDTH_PX}px;
+        height: {KEY_HEIGHT_PX}px;
+        background-color: #FFFFFF;
+        border: 1px solid #333333;
+        z-index: 1;
+    }}
+    .piano-key.black-key {{
+        width: {KEY_WIDTH_PX * BLACK_KEY_WIDTH_RATIO}px;
+        height: {KEY_HEIGHT_PX * BLACK_KEY_HEIGHT_RATIO}px;
+        background-color: #333333;
+        border: 1px solid #111111;
+        z-index: 2;
+    }}
+    .piano-key:active, .piano-key.active {{
+        transform: translateY(2px);
+        box-shadow: none;
+    }}
+    .piano-key.active.white-key {{
+        background-color: #D3D3D3; /* Gray highlight */
+    }}
+    .piano-key.active.black-key {{
+        background-color: #555555; /* Lighter black highlight */
+    }}
+{position_rules}
+    </style>
+    <div class="piano-container" tabindex="0">
+    """
 
-with col3:
-    waveform_type = st.selectbox(
-        "Waveform",
-        ("sine", "sawtooth", "square", "triangle"),
-        help="Choose the tone of the notes."
-    )
-    volume = st.slider(
-        "Volume",
-        min_value=0.0,
-        max_value=1.0,
-        value=0.5,
-        step=0.05,
-        help="Adjust the overall volume."
+    # Collect the HTML fragments and join them once at the end
+    parts = [html_content_prefix]
+    parts.extend(
+        KEY_TMPL.format(
+            **key,
+            kk_span=f"<span class='piano-key-label'>{key['keyboard_key'].upper()}</span>" if key['keyboard_key'] else ""
+        )
+        for key in piano_keys
     )
-
-st.write("---")
-
-# --- Piano Keyboard UI with Sound ---
-piano_keys = get_key_info(start_midi_note, num_keys)
-total_white_keys = sum(1 for key in piano_keys if key['type'] == 'white')
-piano_width = total_white_keys * KEY_WIDTH_PX
-
-# HTML and CSS for the piano
-html_content = f"""
-<style>
-.piano-container {{
-    position: relative;
-    width: {piano_width}px;
-    height: {KEY_HEIGHT_PX}px;
-    margin: 20px auto;
-    border: 2px solid #555;
-    background-color: #eee;
-    border-radius: 5px;
-    box-shadow: 0 5px 15px rgba(0,0,0,0.3);
-    overflow: hidden;
-}}
-.piano-key {{
-    position: absolute;
-    cursor: pointer;
-    box-sizing: border-box;
-    border-radius: 0 0 3px 3px;
-    transition: all 0.1s ease;
-    display: flex;
-    justify-content: center;
-    align-items: flex-end;
-    padding-bottom: 5px;
-    font-size: 0.8em;
-    user-select: none;
-}}
-.piano-key-label {{
-    position: absolute;
-    bottom: 5px;
-    font-size: 0.7em;
-    color: #555;
-}}
-.piano-key.white-key {{
-    background-color: #FFFFFF;
-    border: 1px solid #333333;
-    z-index: 1;
-}}
-.piano-key.black-key {{
-    background-color: #333333;
-    border: 1px solid #111111;
-    z-index: 2;
-}}
-.piano-key:active, .piano-key.active {{
-    transform: translateY(2px);
-    box-shadow: none;
-}}
-.piano-key.active.white-key {{
-    background-color: #D3D3D3; /* Gray highlight */
-}}
-.piano-key.active.black-key {{
-    background-color: #555555; /* Lighter black highlight */
-}}
-</style>
-<div class="piano-container" tabindex="0">
-"""
-
-# Add each key's HTML to the content
-for key in piano_keys:
-    keyboard_key_label = f"<span class='piano-key-label'>{key['keyboard_key'].upper()}</span>" if key['keyboard_key'] else ""
-    html_content += f"""
-    <div class="piano-key {key['type']}-key"
-         style="
-             left: {key['x']}px;
-             top: {key['y']}px;
-             width: {key['width']}px;
-             height: {key['height']}px;
-             background-color: {key['color']};
-             z-index: {key['z_index']};
-         "
-         data-frequency="{key['frequency']}"
-         data-keyboard-key="{key['keyboard_key']}"
-         title="MIDI: {key['midi_note']} | Freq: {key['frequency']:.2f} Hz | Key: {key['keyboard_key']}"
-    >
-        {key['label']} {keyboard_key_label}
-    </div>
-    """
-html_content += "</div>"
+    parts.append("</div>")
+    return "".join(parts)
 
 # --- JavaScript for advanced sound generation and keyboard input ---
-js_code = f"""
+# Static: waveform and volume arrive via postMessage from the config frame,
+# so the piano iframe (and its AudioContext) survives settings changes.
+PIANO_JS = """
 <script>
-    document.addEventListener('DOMContentLoaded', function() {{
+    document.addEventListener('DOMContentLoaded', function() {
         const pianoContainer = document.querySelector('.piano-container');
         const keys = pianoContainer ? pianoContainer.querySelectorAll('.piano-key') : [];
-        const audioContext = new (window.AudioContext || window.webkitAudioContext)();
-
-        // Pass Streamlit values to JavaScript
-        const waveformType = '{waveform_type}';
-        const volume = {volume};
 
-        const activeOscillators = new Map();
+        // Reuse one AudioContext across piano frame reloads. It is created in the
+        // parent page when reachable, since a context owned by this frame dies with it.
+        const audioHost = (() => {
+            try {
+                return window.parent.AudioContext ? window.parent : window;
+            } catch (e) {
+                return window;
+            }
+        })();
+        const audioContext = audioHost.__pianoAudioContext ||
+            (audioHost.__pianoAudioContext = new (audioHost.AudioContext || audioHost.webkitAudioContext)());
+
+        // Everything this frame plays goes through one master gain, which is
+        // disconnected (rather than closing the shared context) on teardown
+        const masterGain = audioContext.createGain();
+        masterGain.connect(audioContext.destination);
+
+        // Keep the audio thread idle until a note is played, and while the tab is hidden
+        audioContext.suspend();
+        document.addEventListener('visibilitychange', () => {
+            if (document.hidden) audioContext.suspend();
+        });
+
+        // One-period wavetables shared by every note; played back as looping buffers
+        const TABLE_SIZE = 2048;
+        const wavetables = {};
+        ['sine', 'sawtooth', 'square', 'triangle'].forEach(type => {
+            const buffer = audioContext.createBuffer(1, TABLE_SIZE, audioContext.sampleRate);
+            const data = buffer.getChannelData(0);
+            for (let i = 0; i < TABLE_SIZE; i++) {
+                const phase = i / TABLE_SIZE;
+                if (type === 'sine') data[i] = Math.sin(2 * Math.PI * phase);
+                else if (type === 'sawtooth') data[i] = 2 * phase - 1;
+                else if (type === 'square') data[i] = phase < 0.5 ? 1 : -1;
+                else data[i] = phase < 0.25 ? 4 * phase : (phase < 0.75 ? 2 - 4 * phase : 4 * phase - 4);
+            }
+            wavetables[type] = buffer;
+        });
+        const tableFrequency = audioContext.sampleRate / TABLE_SIZE;
+
+        // One persistent gain node and a numeric slot per key; only the buffer
+        // source is created per note
+        keys.forEach((key, i) => {
+            key._idx = i;
+            const gainNode = audioContext.createGain();
+            gainNode.gain.value = 0;
+            gainNode.connect(masterGain);
+            key._gainNode = gainNode;
+        });
+
+        // Active notes tracked by key slot instead of a Map keyed on elements
+        const activeMask = new Uint8Array(keys.length);
+        const activeSrc = new Array(keys.length);
+        const noteStart = new Float64Array(keys.length);
+
+        // The shared context outlives this frame, so stop every looping source
+        // (held, sustained or releasing) before detaching from it
+        window.addEventListener('pagehide', () => {
+            for (let i = 0; i < activeMask.length; i++) {
+                if (activeMask[i]) activeSrc[i].stop();
+                if (keys[i]._releasingSource) keys[i]._releasingSource.stop();
+            }
+            masterGain.disconnect();
+        });
         let sustainEnabled = false;
 
+        // Sound settings, kept up to date by the config frame
+        let waveformType = 'sine';
+        let volume = 0.5;
+        window.addEventListener('message', (event) => {
+            // Only trust same-origin config frames, and only well-formed settings
+            // srcdoc frames report an opaque location origin; window.origin is the inherited one
+            if (event.origin !== window.origin) return;
+            if (!event.data || event.data.type !== 'cfg') return;
+            if (Object.prototype.hasOwnProperty.call(wavetables, event.data.wf)) {
+                waveformType = event.data.wf;
+            }
+            if (Number.isFinite(event.data.vol)) {
+                volume = event.data.vol;
+            }
+        });
+        // Ask the config frame for the current settings in case it loaded first
+        for (let i = 0; i < window.parent.frames.length; i++) {
+            window.parent.frames[i].postMessage({ type: 'cfg-request' }, '*');
+        }
+
         // ADSR Envelope parameters
         const attackTime = 0.05;
         const decayTime = 0.2;
         const releaseTime = 0.3;
         const sustainLevel = 0.7;
+        const retriggerFade = 0.005;  // Fade-out of a still-releasing note before retriggering the key
 
-        function playNote(keyElement) {{
-            if (!keyElement || (activeOscillators.has(keyElement))) return;
+        function playNote(keyElement) {
+            if (!keyElement || activeMask[keyElement._idx]) return;
+            if (audioContext.state === 'suspended') audioContext.resume();
 
             const frequency = parseFloat(keyElement.dataset.frequency);
-            const oscillator = audioContext.createOscillator();
-            const gainNode = audioContext.createGain();
-
-            oscillator.type = waveformType;
-            oscillator.frequency.setValueAtTime(frequency, audioContext.currentTime);
-
-            gainNode.gain.setValueAtTime(0, audioContext.currentTime);
-            gainNode.gain.linearRampToValueAtTime(volume, audioContext.currentTime + attackTime);
-            gainNode.gain.exponentialRampToValueAtTime(volume * sustainLevel, audioContext.currentTime + attackTime + decayTime);
-
-            oscillator.connect(gainNode);
-            gainNode.connect(audioContext.destination);
-
-            oscillator.start();
-            activeOscillators.set(keyElement, {{ oscillator, gainNode }});
-        }}
-
-        function stopNote(keyElement) {{
-            if (!keyElement || !activeOscillators.has(keyElement)) return;
-
-            const {{ oscillator, gainNode }} = activeOscillators.get(keyElement);
-            if (!sustainEnabled) {{
+            const source = audioContext.createBufferSource();
+            const gainNode = keyElement._gainNode;
+
+            source.buffer = wavetables[waveformType];
+            source.loop = true;
+            source.playbackRate.value = frequency / tableFrequency;
+
+            let startTime = audioContext.currentTime;
+            gainNode.gain.cancelScheduledValues(startTime);
+            if (keyElement._releasingSource) {
+                // A previous note on this key is still releasing through the shared gain:
+                // fade it out briefly from its current level rather than cutting it off
+                gainNode.gain.setValueAtTime(gainNode.gain.value, startTime);
+                startTime += retriggerFade;
+                gainNode.gain.linearRampToValueAtTime(0, startTime);
+                keyElement._releasingSource.stop(startTime);
+                keyElement._releasingSource = null;
+            } else {
+                // Set the silent starting point directly; only schedule the ramps that matter
+                gainNode.gain.value = 0;
+            }
+            gainNode.gain.linearRampToValueAtTime(volume, startTime + attackTime);
+            if (sustainLevel !== 1 && volume > 0) {
+                gainNode.gain.exponentialRampToValueAtTime(volume * sustainLevel, startTime + attackTime + decayTime);
+            }
+
+            source.connect(gainNode);
+
+            source.start(startTime);
+            activeSrc[keyElement._idx] = source;
+            activeMask[keyElement._idx] = 1;
+            noteStart[keyElement._idx] = startTime;
+        }
+
+        function stopNote(keyElement) {
+            if (!keyElement || !activeMask[keyElement._idx]) return;
+
+            const source = activeSrc[keyElement._idx];
+            const gainNode = keyElement._gainNode;
+            if (!sustainEnabled) {
                 gainNode.gain.cancelScheduledValues(audioContext.currentTime);
-                gainNode.gain.setValueAtTime(gainNode.gain.value, audioContext.currentTime);
-                gainNode.gain.linearRampToValueAtTime(0, audioContext.currentTime + releaseTime);
-                oscillator.stop(audioContext.currentTime + releaseTime);
-                activeOscillators.delete(keyElement);
-            }}
-        }}
-
-        // --- Mouse Events ---
-        keys.forEach(key => {{
-            key.addEventListener('mousedown', () => {{
+                if (releaseTime <= 0 || audioContext.currentTime === noteStart[keyElement._idx]) {
+                    // Nothing audible to fade out yet: just silence and stop
+                    gainNode.gain.value = 0;
+                    source.stop();
+                } else {
+                    gainNode.gain.setValueAtTime(gainNode.gain.value, audioContext.currentTime);
+                    gainNode.gain.linearRampToValueAtTime(0, audioContext.currentTime + releaseTime);
+                    source.stop(audioContext.currentTime + releaseTime);
+                    keyElement._releasingSource = source;
+                    source.onended = () => {
+                        if (keyElement._releasingSource === source) keyElement._releasingSource = null;
+                    };
+                }
+                activeSrc[keyElement._idx] = null;
+                activeMask[keyElement._idx] = 0;
+            }
+        }
+
+        // --- Key highlighting ---
+        // Class changes are queued and applied once per frame to coalesce style recalculation
+        const pendingAdd = new Set();
+        const pendingRemove = new Set();
+        let flushScheduled = false;
+
+        function flushActive() {
+            pendingAdd.forEach(key => key.classList.add('active'));
+            pendingRemove.forEach(key => key.classList.remove('active'));
+            pendingAdd.clear();
+            pendingRemove.clear();
+            flushScheduled = false;
+        }
+
+        function markActive(key, on) {
+            (on ? pendingRemove : pendingAdd).delete(key);
+            (on ? pendingAdd : pendingRemove).add(key);
+            if (!flushScheduled) {
+                flushScheduled = true;
+                requestAnimationFrame(flushActive);
+            }
+        }
+
+        // --- Pointer Events (mouse + touch), delegated to the container ---
+        // Each pointer (mouse, or one per finger) holds its own key
+        const pointerKeys = new Map();
+
+        function releasePointer(event) {
+            const key = pointerKeys.get(event.pointerId);
+            if (!key) return;
+            pointerKeys.delete(event.pointerId);
+            // Another finger may still be holding the same key
+            for (const other of pointerKeys.values()) {
+                if (other === key) return;
+            }
+            stopNote(key);
+            if (!sustainEnabled) markActive(key, false);
+        }
+
+        if (pianoContainer) {
+            pianoContainer.addEventListener('pointerdown', (event) => {
+                const key = event.target.closest('.piano-key');
+                if (!key) return;
+                pointerKeys.set(event.pointerId, key);
                 playNote(key);
-                key.classList.add('active');
-            }});
-            key.addEventListener('mouseup', () => {{
-                stopNote(key);
-                if (!sustainEnabled) key.classList.remove('active');
-            }});
-            key.addEventListener('mouseleave', () => {{
-                stopNote(key);
-                if (!sustainEnabled) key.classList.remove('active');
-            }});
-        }});
+                markActive(key, true);
+            });
+            pianoContainer.addEventListener('pointerup', releasePointer);
+            pianoContainer.addEventListener('pointercancel', releasePointer);
+            pianoContainer.addEventListener('pointerout', (event) => {
+                // Ignore moves between a key and its own label
+                const key = pointerKeys.get(event.pointerId);
+                const next = event.relatedTarget && event.relatedTarget.closest ? event.relatedTarget.closest('.piano-key') : null;
+                if (key && event.target.closest('.piano-key') === key && next !== key) {
+                    releasePointer(event);
+                }
+            });
+        }
 
         // --- Keyboard Events ---
-        const keyMap = new Map();
-        keys.forEach(key => {{
+        // Indexed by event.code so handlers need no string normalisation per event
+        const punctuationCodes = { ';': 'Semicolon', "'": 'Quote' };
+        const codeMap = Object.create(null);
+        keys.forEach(key => {
             const keyboardKey = key.dataset.keyboardKey;
-            if (keyboardKey) {{
-                keyMap.set(keyboardKey, key);
-            }}
-        }});
-
-        document.addEventListener('keydown', (event) => {{
-            if (event.code === 'Space') {{
+            const code = punctuationCodes[keyboardKey] ||
+                (/^[a-z]$/.test(keyboardKey) ? 'Key' + keyboardKey.toUpperCase() : null);
+            if (code) {
+                codeMap[code] = key;
+            }
+        });
+
+        document.addEventListener('keydown', (event) => {
+            // Held keys auto-repeat; the note is already playing
+            if (event.repeat) return;
+            if (event.code === 'Space') {
                 sustainEnabled = true;
                 return;
-            }}
-            const keyElement = keyMap.get(event.key.toLowerCase());
-            if (keyElement) {{
+            }
+            const keyElement = codeMap[event.code];
+            if (keyElement) {
                 playNote(keyElement);
-                keyElement.classList.add('active');
-            }}
-        }});
+                markActive(keyElement, true);
+            }
+        });
 
-        document.addEventListener('keyup', (event) => {{
-            if (event.code === 'Space') {{
+        document.addEventListener('keyup', (event) => {
+            if (event.code === 'Space') {
                 sustainEnabled = false;
                 // Stop all sustained notes
-                activeOscillators.forEach((value, keyElement) => {{
-                    stopNote(keyElement);
-                    keyElement.classList.remove('active');
-                }});
+                for (let i = 0; i < activeMask.length; i++) {
+                    if (activeMask[i]) {
+                        stopNote(keys[i]);
+                        markActive(keys[i], false);
+                    }
+                }
                 return;
-            }}
-            const keyElement = keyMap.get(event.key.toLowerCase());
-            if (keyElement && !sustainEnabled) {{
+            }
+            const keyElement = codeMap[event.code];
+            if (keyElement && !sustainEnabled) {
                 stopNote(keyElement);
-                keyElement.classList.remove('active');
-            }}
-        }});
+                markActive(keyElement, false);
+            }
+        });
+    });
+</script>
+"""
+
+# Tiny frame that pushes the current waveform/volume to the piano frame
+PIANO_CFG_JS = """
+<script>
+    const cfg = {{ type: 'cfg', wf: '{waveform_type}', vol: {volume} }};
+    function broadcast() {{
+        for (let i = 0; i < window.parent.frames.length; i++) {{
+            window.parent.frames[i].postMessage(cfg, '*');
+        }}
+    }}
+    window.addEventListener('message', (event) => {{
+        if (event.data && event.data.type === 'cfg-request') broadcast();
     }});
+    broadcast();
 </script>
 """
 
-# Combine and render the full HTML
-full_html_content = html_content + js_code
-st.components.v1.html(full_html_content, height=KEY_HEIGHT_PX + 40)
\ No newline at end of file
+# --- Streamlit App ---
+st.set_page_config(layout="centered", page_title="Streamlit Virtual Piano")
+
+st.title("Streamlit Virtual Piano")
+st.markdown("Play using your **mouse** or **keyboard**! Press the **spacebar** for sustain.")
+st.write("---")
+
+# --- Piano Settings ---
+col1, col2, col3 = st.columns([1, 1, 0.7])
+
+with col1:
+    num_keys = st.slider(
+        "Number of Keys",
+        min_value=12,
+        max_value=30,
+        value=DEFAULT_KEYS,
+        step=1,
+        help="Adjust the total number of piano keys."
+    )
+
+with col2:
+    start_midi_note = st.slider(
+        "Starting MIDI Note (C4=60)",
+        min_value=21,
+        max_value=96,
+        value=60,
+        step=1,
+        help="Select the MIDI note number for the leftmost key."
+    )
+
+with col3:
+    # Sound settings are applied together, so dragging a slider doesn't rerun the app
+    with st.form("cfg"):
+        waveform_type = st.selectbox(
+            "Waveform",
+            ("sine", "sawtooth", "square", "triangle"),
+            help="Choose the tone of the notes."
+        )
+        volume = st.slider(
+            "Volume",
+            min_value=0.0,
+            max_value=1.0,
+            value=0.5,
+            step=0.05,
+            help="Adjust the overall volume."
+        )
+        st.form_submit_button("Apply")
+
+st.write("---")
+
+# --- Piano Keyboard UI with Sound ---
+# The piano markup is only rebuilt when the layout changes. Re-emitting the
+# identical string lets Streamlit keep the running iframe across reruns;
+# sound settings are streamed in by a second frame.
+piano_signature = (num_keys, start_midi_note)
+if st.session_state.get("piano_signature") != piano_signature:
+    st.session_state.piano_signature = piano_signature
+    st.session_state.piano_html = build_piano_html(start_midi_note, num_keys) + PIANO_JS
+st.components.v1.html(st.session_state.piano_html, height=KEY_HEIGHT_PX + 40)
+st.components.v1.html(PIANO_CFG_JS.format(waveform_type=waveform_type, volume=volume), height=0)
\ No newline at end of file